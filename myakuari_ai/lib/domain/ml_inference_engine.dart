@@ -1,5 +1,6 @@
 import 'dart:convert';
 import 'dart:math' as math;
+import 'dart:typed_data';
 import 'package:flutter/services.dart';
 import 'models/inference_models.dart';
 
@@ -13,17 +14,64 @@ class MLInferenceEngine {
   Map<String, dynamic>? _meta;
   bool _loaded = false;
 
+  // feature_weights.bin (ml_training/weight_blob.py) の float32 配列をそのまま参照するビュー
+  static const int _weightsVersion = 1;
+  static const int _headerSize = 16;
+  late int _nFeatures;
+  late int _nClasses;
+  late Float32List _mean;
+  late Float32List _std;
+  late Float32List _coef; // [C * F] 行優先
+  late Float32List _bias;
+
+  // TreeSHAP を蒸留した特徴量ごとの区分線形寄与モデル (脈アリの softmax マージン/logit。one-vs-rest の log-odds ではない)。なければ重要度ヒューリスティック
+  static const double _pointsPerLogit = 15.0;
+  List<Float64List>? _attrKnots;
+  List<Float64List>? _attrValues;
+
   Future<void> load() async {
     if (_loaded) return;
     try {
       final raw = await rootBundle.loadString('assets/ml/feature_metadata.json');
       _meta = jsonDecode(raw) as Map<String, dynamic>;
+      final weightsFile = (_meta!['weights_file'] as String?) ?? 'feature_weights.bin';
+      _loadWeights(await rootBundle.load('assets/ml/$weightsFile'));
+      _loadAttribution();
       _loaded = true;
     } catch (_) {
       _loaded = false;
     }
   }
 
+  void _loadWeights(ByteData blob) {
+    final magic = String.fromCharCodes([for (int i = 0; i < 4; i++) blob.getUint8(i)]);
+    final version = blob.getUint16(4, Endian.little);
+    if (magic != 'MKW1' || version != _weightsVersion) {
+      throw FormatException('Unsupported weight blob: $magic v$version');
+    }
+    _nFeatures = blob.getUint16(8, Endian.little);
+    _nClasses  = blob.getUint16(10, Endian.little);
+
+    final count  = 2 * _nFeatures + _nClasses * _nFeatures + _nClasses;
+    final offset = blob.offsetInBytes + _headerSize;
+    final Float32List all;
+    if (Endian.host == Endian.little && offset % 4 == 0) {
+      // ゼロコピー: アセットのバッファをそのまま float32 として参照
+      all = blob.buffer.asFloat32List(offset, count);
+    } else {
+      all = Float32List(count);
+      for (int i = 0; i < count; i++) {
+        all[i] = blob.getFloat32(_headerSize + i * 4, Endian.little);
+      }
+    }
+
+    final f = _nFeatures, c = _nClasses;
+    _mean = Float32List.sublistView(all, 0, f);
+    _std  = Float32List.sublistView(all, f, 2 * f);
+    _coef = Float32List.sublistView(all, 2 * f, 2 * f + c * f);
+    _bias = Float32List.sublistView(all, 2 * f + c * f, count);
+  }
+
   bool get isLoaded => _loaded;
 
   InferenceResult? analyze(InferenceInput input) {
@@ -151,21 +199,40 @@ class MLInferenceEngine {
     return [attrO, sincO, intelO, funO, sharO, likeO, probO, metO, impraceO, imprelO];
   }
 
+  void _loadAttribution() {
+    final attribution = _meta!['attribution_model'] as Map<String, dynamic>?;
+    if (attribution == null) return;
+    final perFeature = attribution['features'] as Map<String, dynamic>;
+    final featNames  = (_meta!['features'] as List).cast<String>();
+    Float64List toList(dynamic v) =>
+        Float64List.fromList((v as List).map((e) => (e as num).toDouble()).toList());
+    _attrKnots  = [for (final nm in featNames) toList(perFeature[nm]['knots'])];
+    _attrValues = [for (final nm in featNames) toList(perFeature[nm]['values'])];
+  }
+
+  /// ノット間の線形補間 (範囲外は端の値)
+  double _interp(double x, Float64List knots, Float64List values) {
+    if (x <= knots.first) return values.first;
+    if (x >= knots.last) return values.last;
+    int i = 1;
+    while (knots[i] < x) {
+      i++;
+    }
+    final t = (x - knots[i - 1]) / (knots[i] - knots[i - 1]);
+    return values[i - 1] + t * (values[i] - values[i - 1]);
+  }
+
   List<double> _linearPredict(List<double> raw) {
-    final mean = (_meta!['scaler_mean'] as List).map((e) => (e as num).toDouble()).toList();
-    final std  = (_meta!['scaler_std']  as List).map((e) => (e as num).toDouble()).toList();
-    final coef = (_meta!['lr_coef'] as List)
-        .map((row) => (row as List).map((e) => (e as num).toDouble()).toList())
-        .toList();
-    final bias = (_meta!['lr_bias'] as List).map((e) => (e as num).toDouble()).toList();
-
-    final scaled = List.generate(raw.length, (i) => (raw[i] - mean[i]) / std[i]);
-    final logits = List<double>.filled(3, 0);
-    for (int c = 0; c < 3; c++) {
-      logits[c] = bias[c];
-      for (int j = 0; j < scaled.length; j++) {
-        logits[c] += coef[c][j] * scaled[j];
+    final n = math.min(raw.length, _nFeatures);
+    final scaled = List<double>.generate(n, (i) => (raw[i] - _mean[i]) / _std[i]);
+    final logits = List<double>.filled(_nClasses, 0);
+    for (int c = 0; c < _nClasses; c++) {
+      final row = c * _nFeatures;
+      double acc = _bias[c];
+      for (int j = 0; j < n; j++) {
+        acc += _coef[row + j] * scaled[j];
       }
+      logits[c] = acc;
     }
     return logits;
   }
@@ -187,14 +254,25 @@ class MLInferenceEngine {
       final nm  = featNames[i];
       final imp = (importance[nm] as num).toDouble();
       final val = features[i];
-      final impact = ((val - 5.5) * imp * 30).round();
       final d = (desc[nm] as String?) ?? nm;
+
+      final int impact;
+      final String reason;
+      if (_attrKnots != null) {
+        // この入力に対する TreeSHAP 寄与 (区分線形近似)
+        final phi = _interp(val, _attrKnots![i], _attrValues![i]);
+        impact = (phi * _pointsPerLogit).round();
+        reason = '【SHAP寄与 ${phi >= 0 ? '+' : ''}${phi.toStringAsFixed(2)}】';
+      } else {
+        impact = ((val - 5.5) * imp * 30).round();
+        reason = '【ML重要度 ${(imp * 100).toStringAsFixed(0)}%】';
+      }
       factors.add(Factor(
         id: 'f$i',
         title: d.split('(').first.trim(),
         description: '$d → ${val.toStringAsFixed(1)}',
         scoreImpact: impact,
-        reason: '【ML重要度 ${(imp * 100).toStringAsFixed(0)}%】',
+        reason: reason,
       ));
     }
     factors.sort((a, b) => b.scoreImpact.abs().compareTo(a.scoreImpact.abs()));
@@ -80,7 +80,13 @@ def generate_big_romance_data(samples=1000000):
     return df
 
 if __name__ == "__main__":
-    df = generate_big_romance_data()
+    import sys
+    if len(sys.argv) > 1:
+        # シナリオ (YAML/JSON) が指定されたら宣言的エンジンで生成するのだ
+        from scenario_engine import generate_from_scenario
+        df = generate_from_scenario(sys.argv[1])
+    else:
+        df = generate_big_romance_data()
     # メモリ節約のため、一旦 pickle or parquet で保存
     df.to_pickle("c:/Projects/myakuarimyakunasiAIkunn/myakuari_ai/ml_training/big_romance_dataset.pkl")
     print("データセットを big_romance_dataset.pkl に保存したのだ。")
@@ -8,6 +8,8 @@ import time
 import json
 import os
 import math
+import argparse
+import tempfile
 
 """
 PyTorch Edge-Transformer Trainer for Romance Diagnosis (2026 Standard)
@@ -31,8 +33,14 @@ else:
 
 # ── 2026 Edge-Transformer Architecture ──
 class EdgeTransformerNet(nn.Module):
-    def __init__(self, input_size=24, d_model=128, nhead=8, num_layers=4, num_classes=3):
+    def __init__(self, input_size=24, d_model=128, nhead=8, num_layers=4, num_classes=3, consensus_width=256):
         super(EdgeTransformerNet, self).__init__()
+        self.config = {
+            "d_model": d_model,
+            "nhead": nhead,
+            "num_layers": num_layers,
+            "consensus_width": consensus_width,
+        }
         
         # 1. Feature Tokenizer (Embedding Layer)
         # Each input feature is projected into its own embedding space
@@ -54,13 +62,13 @@ class EdgeTransformerNet(nn.Module):
         
         # 4. Neuro-Symbolic Consensus Layer
         self.consensus_layer = nn.Sequential(
-            nn.Linear(d_model * input_size, 256),
+            nn.Linear(d_model * input_size, consensus_width),
             nn.Mish(),
-            nn.BatchNorm1d(256),
+            nn.BatchNorm1d(consensus_width),
             nn.Dropout(0.2),
-            nn.Linear(256, 64),
+            nn.Linear(consensus_width, consensus_width // 4),
             nn.Mish(),
-            nn.Linear(64, num_classes)
+            nn.Linear(consensus_width // 4, num_classes)
         )
 
     def forward(self, x):
@@ -81,7 +89,7 @@ class EdgeTransformerNet(nn.Module):
         logits = self.consensus_layer(encoded_flat)
         return logits
 
-def train_edge_transformer(pickle_path, output_onnx_path):
+def load_dataset(pickle_path):
     print(f"Loading Dataset: {pickle_path}...")
     df = pd.read_pickle(pickle_path)
     
@@ -91,29 +99,27 @@ def train_edge_transformer(pickle_path, output_onnx_path):
     
     # Normalization (Crucial for Transformers)
     X = (X - X.mean(axis=0)) / (X.std(axis=0) + 1e-6)
-    
+    return X, y, features_list
+
+def fit_model(model, X, y, epochs=10, batch_size=4096):
     X_tensor = torch.tensor(X)
     y_tensor = torch.tensor(y)
     
     dataset = TensorDataset(X_tensor, y_tensor)
-    batch_size = 4096 # Transformer uses more memory, adjust for RTX 5060
+    # Transformer uses more memory, adjust batch_size for RTX 5060
     dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True, pin_memory=True)
     
-    model = EdgeTransformerNet(input_size=X.shape[1]).to(device)
-    print(f"Model Architecture: Edge-Transformer v2.0 | Parameters: {sum(p.numel() for p in model.parameters()):,}")
-    
     criterion = nn.CrossEntropyLoss(label_smoothing=0.1)
     optimizer = optim.AdamW(model.parameters(), lr=1e-4, weight_decay=1e-2)
     
     # 2026 Standard: OneCycleLR with high intensity
     scheduler = optim.lr_scheduler.OneCycleLR(
-        optimizer, max_lr=1e-3, epochs=10, steps_per_epoch=len(dataloader)
+        optimizer, max_lr=1e-3, epochs=epochs, steps_per_epoch=len(dataloader)
     )
     
     scaler = torch.amp.GradScaler('cuda') if torch.cuda.is_available() else None
     
-    print("\nStarting Transformer Optimization Sequence...")
-    for epoch in range(10):
+    for epoch in range(epochs):
         model.train()
         total_loss = 0
         correct = 0
@@ -141,11 +147,21 @@ def train_edge_transformer(pickle_path, output_onnx_path):
             correct += (pred == batch_y).sum().item()
             
         print(f"Epoch {epoch+1:02d} | Loss: {total_loss/len(dataloader):.4f} | Acc: {correct/len(dataset):.4f}")
+    return model
 
-    # ── ONNX Export (Standard 2026) ──
-    print("\nExporting to ONNX (Opset 18)...")
+@torch.no_grad()
+def evaluate_accuracy(model, X, y, batch_size=8192):
+    model.eval()
+    correct = 0
+    for i in range(0, len(X), batch_size):
+        batch_X = torch.tensor(X[i:i + batch_size], device=device)
+        pred = model(batch_X).argmax(dim=1).cpu().numpy()
+        correct += int((pred == y[i:i + batch_size]).sum())
+    return correct / len(X)
+
+def export_onnx(model, n_features, output_onnx_path):
     model.eval()
-    dummy_input = torch.randn(1, X.shape[1], device='cpu')
+    dummy_input = torch.randn(1, n_features, device='cpu')
     model.cpu()
     
     torch.onnx.export(
@@ -159,22 +175,181 @@ def train_edge_transformer(pickle_path, output_onnx_path):
         output_names=['output'],
         dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}}
     )
-    
-    # Save Metadata
+
+def save_metadata(cfg, features_list, output_onnx_path, extra=None):
     meta = {
         "engine": "Edge-Transformer-v2.0",
         "precision": "INT8-Quantizable",
         "features": features_list,
-        "layers": 6,
-        "attention_heads": 8,
+        "d_model": cfg["d_model"],
+        "layers": cfg["num_layers"],
+        "attention_heads": cfg["nhead"],
+        "consensus_width": cfg["consensus_width"],
         "xai": "Attention-Weight-Tracing"
     }
+    if extra:
+        meta.update(extra)
     with open(output_onnx_path.replace('.onnx', '_meta.json'), 'w') as f:
         json.dump(meta, f, indent=2)
+
+def train_edge_transformer(pickle_path, output_onnx_path, config=None, extra_metadata=None):
+    """Full-scale training. config overrides the EdgeTransformerNet architecture (e.g. a sweep winner)."""
+    X, y, features_list = load_dataset(pickle_path)
+    
+    model = EdgeTransformerNet(input_size=X.shape[1], **(config or {})).to(device)
+    print(f"Model Architecture: Edge-Transformer v2.0 | Parameters: {sum(p.numel() for p in model.parameters()):,}")
+    
+    print("\nStarting Transformer Optimization Sequence...")
+    fit_model(model, X, y, epochs=10)
+
+    # ── ONNX Export (Standard 2026) ──
+    print("\nExporting to ONNX (Opset 18)...")
+    export_onnx(model, X.shape[1], output_onnx_path)
+    save_metadata(model.config, features_list, output_onnx_path, extra=extra_metadata)
     
     print(f"Inference Model saved to {output_onnx_path}")
 
+# ── Latency-Budgeted Architecture Sweep ──
+SWEEP_GRID = {
+    "d_model": [32, 64, 128],
+    "num_layers": [1, 2, 4],
+    "nhead": [2, 4, 8],
+    "consensus_width": [64, 128, 256],
+}
+
+def measure_cpu_latency(onnx_path, n_features, runs=200, warmup=20):
+    """Median / p95 single-thread CPU latency (ms) of a batch=1 ONNX Runtime call.
+    The app scores one row per call, so this is the per-row latency it will see."""
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = 1
+    opts.inter_op_num_threads = 1
+    session = ort.InferenceSession(onnx_path, opts, providers=['CPUExecutionProvider'])
+    x = np.random.randn(1, n_features).astype(np.float32)
+    for _ in range(warmup):
+        session.run(None, {'input': x})
+    timings = np.empty(runs)
+    for i in range(runs):
+        t0 = time.perf_counter()
+        session.run(None, {'input': x})
+        timings[i] = (time.perf_counter() - t0) * 1000.0
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+def pareto_front(results):
+    """Flag candidates not dominated on (accuracy up, latency_ms down, size_kb down)."""
+    for r in results:
+        r["pareto"] = not any(
+            o is not r
+            and o["accuracy"] >= r["accuracy"]
+            and o["latency_ms"] <= r["latency_ms"]
+            and o["size_kb"] <= r["size_kb"]
+            and (o["accuracy"] > r["accuracy"] or o["latency_ms"] < r["latency_ms"] or o["size_kb"] < r["size_kb"])
+            for o in results
+        )
+    return results
+
+def sweep_edge_transformer(pickle_path, output_onnx_path, latency_budget_ms,
+                           subsample=100000, epochs=2, grid=None, seed=42):
+    """Briefly train each d_model / layers / heads / consensus-width candidate on a subsample,
+    export it to ONNX and time it on CPU, then retrain the most accurate architecture within the
+    latency budget at full scale. The short-trained candidates themselves are never shipped."""
+    grid = grid or SWEEP_GRID
+    X, y, _ = load_dataset(pickle_path)
+    n_features = X.shape[1]
+
+    rng = np.random.default_rng(seed)
+    idx = rng.permutation(len(X))[:subsample]
+    split = int(len(idx) * 0.8)
+    X_tr, y_tr = X[idx[:split]], y[idx[:split]]
+    X_va, y_va = X[idx[split:]], y[idx[split:]]
+    del X, y   # the full dataset is reloaded for the final retrain
+
+    configs = [
+        {"d_model": d, "num_layers": l, "nhead": h, "consensus_width": w}
+        for d in grid["d_model"]
+        for l in grid["num_layers"]
+        for h in grid["nhead"]
+        for w in grid["consensus_width"]
+        if d % h == 0
+    ]
+    print(f"\nSweeping {len(configs)} architectures on {len(X_tr):,} rows x {epochs} epochs "
+          f"(budget: {latency_budget_ms:.3f} ms/row)...")
+
+    results = []
+    best = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, cfg in enumerate(configs):
+            torch.manual_seed(seed)
+            model = EdgeTransformerNet(input_size=n_features, **cfg).to(device)
+            print(f"\n[{i+1}/{len(configs)}] {cfg}")
+            fit_model(model, X_tr, y_tr, epochs=epochs)
+            acc = evaluate_accuracy(model, X_va, y_va)
+
+            onnx_path = os.path.join(tmp_dir, f"candidate_{i}.onnx")
+            export_onnx(model, n_features, onnx_path)
+            latency_ms, p95_ms = measure_cpu_latency(onnx_path, n_features)
+            result = {
+                **cfg,
+                "params": sum(p.numel() for p in model.parameters()),
+                "accuracy": acc,
+                "latency_ms": latency_ms,
+                "p95_ms": p95_ms,
+                "size_kb": os.path.getsize(onnx_path) / 1024.0,
+            }
+            results.append(result)
+            del model
+            os.remove(onnx_path)
+
+            if latency_ms <= latency_budget_ms and (
+                best is None or (acc, -latency_ms) > (best["accuracy"], -best["latency_ms"])
+            ):
+                best = result
+
+    pareto_front(results)
+    results.sort(key=lambda r: (r["latency_ms"], -r["accuracy"]))
+
+    print("\n── Pareto Table (accuracy vs latency/size) ──")
+    print(f"{'d_model':>7} {'layers':>6} {'heads':>5} {'width':>5} {'params':>10} "
+          f"{'acc':>7} {'ms/row':>8} {'p95':>8} {'KB':>9}  pareto")
+    for r in results:
+        print(f"{r['d_model']:>7} {r['num_layers']:>6} {r['nhead']:>5} {r['consensus_width']:>5} "
+              f"{r['params']:>10,} {r['accuracy']:>7.4f} {r['latency_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+              f"{r['size_kb']:>9.1f}  {'*' if r['pareto'] else ''}")
+
+    if best is None:
+        print(f"\nNo architecture meets the {latency_budget_ms:.3f} ms budget. Nothing exported.")
+        return results, None
+
+    print(f"\nSelected: d_model={best['d_model']} layers={best['num_layers']} heads={best['nhead']} "
+          f"width={best['consensus_width']} | Acc {best['accuracy']:.4f} | {best['latency_ms']:.3f} ms/row")
+
+    print("\nRetraining the selected architecture on the full dataset...")
+    best_cfg = {k: best[k] for k in ("d_model", "num_layers", "nhead", "consensus_width")}
+    train_edge_transformer(pickle_path, output_onnx_path, config=best_cfg, extra_metadata={
+        "sweep": {
+            "latency_budget_ms": latency_budget_ms,
+            "cpu_latency_ms": round(best["latency_ms"], 4),
+            "candidate_val_accuracy": round(best["accuracy"], 4),
+            "size_kb": round(best["size_kb"], 1),
+            "subsample": int(subsample),
+            "epochs": epochs,
+        }
+    })
+    return results, best
+
 if __name__ == "__main__":
     data_path = r"C:\Projects\myakuarimyakunasiAIkunn\myakuari_ai\ml_training\big_romance_dataset.pkl"
     out_onnx  = r"C:\Projects\myakuarimyakunasiAIkunn\myakuari_ai\assets\ml\deep_romance_transformer.onnx"
-    train_edge_transformer(data_path, out_onnx)
+
+    parser = argparse.ArgumentParser(description="Edge-Transformer trainer")
+    parser.add_argument("--sweep", action="store_true", help="run the latency-budgeted architecture sweep")
+    parser.add_argument("--latency-budget-ms", type=float, default=1.0, help="max CPU latency per row (ms)")
+    parser.add_argument("--subsample", type=int, default=100000, help="rows used per sweep candidate")
+    parser.add_argument("--epochs", type=int, default=2, help="epochs per sweep candidate")
+    args = parser.parse_args()
+
+    if args.sweep:
+        sweep_edge_transformer(data_path, out_onnx, args.latency_budget_ms,
+                               subsample=args.subsample, epochs=args.epochs)
+    else:
+        train_edge_transformer(data_path, out_onnx)
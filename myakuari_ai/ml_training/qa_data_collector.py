@@ -46,6 +46,13 @@ class RealDataCollector:
             json.dump(self.results, f, ensure_ascii=False, indent=2)
         print(f"データセットを {filepath} に保存したのだ。これを Python (XGBoost) の学習に回すのだ！")
 
+    def save_jsonl(self, filepath):
+        # 1 行 1 件の JSONL シャード (text_featurizer.py で並列に特徴量化できる形式)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for sample in self.results:
+                f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+        print(f"JSONL シャードを {filepath} に保存したのだ。text_featurizer.py で特徴量化するのだ！")
+
 if __name__ == "__main__":
     collector = RealDataCollector()
     data = collector.collect_samples(pages=1)
@@ -0,0 +1,424 @@
+import argparse
+import ast
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+"""
+【宣言的シナリオエンジン】
+合成データのシナリオ (特徴量の分布・相関・交差項・ペナルティ・ノイズ・ラベル閾値) を
+YAML/JSON で記述し、チャンク単位の融合評価器にコンパイルして生成する。
+
+- スコア式は 1 本の式にまとめ、numexpr があれば numexpr で、なければ
+  事前確保したスクラッチバッファ上の in-place ufunc 列で評価する (チャンク毎の一時配列なし)。
+- 相関はガウシアン・コピュラで与える (周辺分布はそのまま保たれる)。
+- 出力は big_data_generator と同じ列構成 (24 特徴量 + target + score) の DataFrame。
+
+  python scenario_engine.py scenarios/default.yaml --samples 1000000 --out big_romance_dataset.pkl
+  python scenario_engine.py scenarios/default.yaml --benchmark
+"""
+
+DEFAULT_CHUNK = 1 << 16
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+
+def load_scenario(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+# ── 周辺分布 (どれも out へ in-place で書き込む) ──
+class Uniform:
+    def __init__(self, low=0.0, high=1.0):
+        self.low, self.high = float(low), float(high)
+
+    def from_uniform(self, u, out):
+        if out is not u:
+            out[:] = u
+        if (self.low, self.high) != (0.0, 1.0):
+            out *= (self.high - self.low)
+            out += self.low
+
+    def sample(self, rng, out):
+        rng.random(out=out)
+        self.from_uniform(out, out)
+
+
+class Normal:
+    def __init__(self, mean=0.0, std=1.0, clip=None):
+        self.mean, self.std = float(mean), float(std)
+        self.clip = clip
+
+    def _finish(self, out):
+        out *= self.std
+        out += self.mean
+        if self.clip is not None:
+            np.clip(out, self.clip[0], self.clip[1], out=out)
+
+    def from_normal(self, z, out):
+        if out is not z:
+            out[:] = z
+        self._finish(out)
+
+    def from_uniform(self, u, out):
+        from scipy.special import ndtri
+        ndtri(u, out=out)
+        self._finish(out)
+
+    def sample(self, rng, out):
+        rng.standard_normal(out=out)
+        self._finish(out)
+
+
+class Beta:
+    def __init__(self, a, b):
+        self.a, self.b = float(a), float(b)
+
+    def from_uniform(self, u, out):
+        from scipy.special import betaincinv
+        betaincinv(self.a, self.b, u, out=out)
+
+    def sample(self, rng, out):
+        out[:] = rng.beta(self.a, self.b, size=len(out))
+
+
+class Bernoulli:
+    def __init__(self, p):
+        self.p = float(p)
+
+    def from_uniform(self, u, out):
+        np.less(u, self.p, out=out)
+
+    def sample(self, rng, out):
+        rng.random(out=out)
+        self.from_uniform(out, out)
+
+
+class Choice:
+    def __init__(self, values, probs=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        cum = np.cumsum(probs if probs is not None else np.full(len(values), 1.0 / len(values)))
+        self.cum = cum / cum[-1]
+
+    def from_uniform(self, u, out):
+        out[:] = self.values[np.searchsorted(self.cum, u, side='right').clip(0, len(self.values) - 1)]
+
+    def sample(self, rng, out):
+        rng.random(out=out)
+        self.from_uniform(out, out)
+
+
+DISTRIBUTIONS = {
+    "uniform": Uniform,
+    "normal": Normal,
+    "beta": Beta,
+    "bernoulli": Bernoulli,
+    "choice": Choice,
+}
+
+
+def make_distribution(cfg):
+    cfg = dict(cfg or {"dist": "uniform"})
+    kind = cfg.pop("dist", "uniform")
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"unknown distribution: {kind}")
+    return DISTRIBUTIONS[kind](**cfg)
+
+
+# ── 式のコンパイル ──
+_BINOPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+_BINOP_SYMBOLS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Pow: '**'}
+
+
+def _validate(node, names):
+    """四則演算・べき乗・単項マイナス・数値・特徴量名だけを許可する。"""
+    if isinstance(node, ast.Expression):
+        return _validate(node.body, names)
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOP_SYMBOLS:
+        _validate(node.left, names)
+        _validate(node.right, names)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        _validate(node.operand, names)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        pass
+    elif isinstance(node, ast.Name):
+        if node.id not in names:
+            raise ValueError(f"unknown feature in expression: {node.id}")
+    else:
+        raise ValueError(f"unsupported expression element: {ast.dump(node)}")
+
+
+class UfuncProgram:
+    """式の AST を in-place ufunc 呼び出し列に変換する。
+    中間値はチャンク長のスクラッチバッファに割り当て、使い終わったものは再利用する。"""
+
+    def __init__(self, tree):
+        self.steps = []
+        self.n_slots = 0
+        self._free = []
+        self.result = self._emit(tree.body)
+
+    def _alloc(self):
+        if self._free:
+            return self._free.pop()
+        self.n_slots += 1
+        return ('slot', self.n_slots - 1)
+
+    def _release(self, operand):
+        if operand[0] == 'slot':
+            self._free.append(operand)
+
+    def _target(self, *operands):
+        for op in operands:
+            if op[0] == 'slot':
+                return op
+        return self._alloc()
+
+    def _emit(self, node):
+        if isinstance(node, ast.Constant):
+            return ('const', float(node.value))
+        if isinstance(node, ast.Name):
+            return ('col', node.id)
+        if isinstance(node, ast.UnaryOp):
+            operand = self._emit(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            if operand[0] == 'const':
+                return ('const', -operand[1])
+            out = self._target(operand)
+            self.steps.append((np.negative, (operand,), out))
+            return out
+
+        left, right = self._emit(node.left), self._emit(node.right)
+        if left[0] == 'const' and right[0] == 'const':
+            return ('const', float(eval(compile(ast.Expression(node), '<scenario>', 'eval'))))
+        out = self._target(left, right)
+        if isinstance(node.op, ast.Pow) and right == ('const', 2.0):
+            self.steps.append((np.square, (left,), out))
+        elif isinstance(node.op, ast.Pow):
+            self.steps.append((np.power, (left, right), out))
+        else:
+            self.steps.append((_BINOPS[type(node.op)], (left, right), out))
+        for op in (left, right):
+            if op != out:
+                self._release(op)
+        return out
+
+    def run(self, columns, out, scratch):
+        def resolve(op):
+            kind, v = op
+            return columns[v] if kind == 'col' else scratch[v] if kind == 'slot' else v
+
+        if self.result[0] != 'slot':
+            out[:] = resolve(self.result)
+            return out
+        # 最終結果のスロットを out に差し替えて、結果を直接書き込む
+        res_slot = self.result[1]
+        def resolve_out(op):
+            return out if op == ('slot', res_slot) else resolve(op)
+        for ufunc, args, dst in self.steps:
+            ufunc(*(resolve_out(a) for a in args), out=resolve_out(dst))
+        return out
+
+
+class CompiledScenario:
+    def __init__(self, spec, chunk_size=DEFAULT_CHUNK, backend=None):
+        self.spec = spec
+        self.chunk_size = chunk_size
+        self.seed = spec.get("seed", 42)
+        self.feature_names = list(spec["features"])
+        self.distributions = {n: make_distribution(c) for n, c in spec["features"].items()}
+
+        self._build_copula(spec.get("correlations") or [])
+
+        score = spec["score"]
+        terms = [(t["expr"], float(t["weight"])) for t in score.get("terms", [])]
+        terms += [(t["expr"], -float(t["weight"])) for t in score.get("penalties", [])]
+        self.expression = "(({}) + {}) * {}".format(
+            " + ".join(f"({e}) * {w!r}" for e, w in terms) or "0.0",
+            float(score.get("offset", 0.0)),
+            float(score.get("scale", 1.0)),
+        )
+        tree = ast.parse(self.expression, mode='eval')
+        _validate(tree, set(self.feature_names))
+
+        self.backend = backend or ("numexpr" if ne is not None else "ufunc")
+        if self.backend == "ufunc":
+            self._program = UfuncProgram(tree)
+
+        self.noise_std = float((spec.get("noise") or {}).get("std", 0.0))
+        labels = spec.get("labels") or {}
+        self.thresholds = [float(t) for t in labels.get("thresholds", [40, 75])]
+        # 閾値ごとに、ちょうど閾値のときも超えたとみなすか (既定: すべて >=)
+        self.inclusive = [bool(v) for v in labels.get("inclusive", [True] * len(self.thresholds))]
+        if len(self.inclusive) != len(self.thresholds):
+            raise ValueError("labels.inclusive must have one entry per threshold")
+        self.clip = labels.get("clip", [0, 100])
+
+    def _build_copula(self, correlations):
+        """相関指定に登場する特徴量をガウシアン・コピュラでまとめて生成する。"""
+        names = []
+        for c in correlations:
+            for n in c["features"]:
+                if n not in self.distributions:
+                    raise ValueError(f"unknown feature in correlations: {n}")
+                if n not in names:
+                    names.append(n)
+        self.copula_names = names
+        if not names:
+            self.copula_chol = None
+            return
+        idx = {n: i for i, n in enumerate(names)}
+        corr = np.eye(len(names))
+        for c in correlations:
+            a, b = c["features"]
+            corr[idx[a], idx[b]] = corr[idx[b], idx[a]] = float(c["rho"])
+        try:
+            self.copula_chol = np.linalg.cholesky(corr)
+        except np.linalg.LinAlgError:
+            raise ValueError("correlation matrix is not positive definite")
+
+    def _fill_copula(self, rng, block, start, end):
+        from scipy.special import ndtr
+        k, m = len(self.copula_names), end - start
+        z = rng.standard_normal((k, m))
+        z = self.copula_chol @ z
+        for i, name in enumerate(self.copula_names):
+            dist = self.distributions[name]
+            out = block[self.feature_names.index(name), start:end]
+            if isinstance(dist, Normal):
+                dist.from_normal(z[i], out)
+            else:
+                ndtr(z[i], out=z[i])
+                dist.from_uniform(z[i], out)
+
+    def _evaluate(self, cols, out, scratch):
+        if self.backend == "numexpr":
+            ne.evaluate(self.expression, local_dict=cols, out=out)
+        else:
+            self._program.run(cols, out, scratch)
+
+    def generate(self, samples, seed=None):
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        n_feat = len(self.feature_names)
+        block = np.empty((n_feat, samples), dtype=np.float64)   # 特徴量ごとに連続
+        score = np.empty(samples, dtype=np.float64)
+        target = np.zeros(samples, dtype=np.int64)
+
+        independent = [i for i, n in enumerate(self.feature_names) if n not in self.copula_names]
+        n_slots = self._program.n_slots if self.backend == "ufunc" else 0
+        scratch = [np.empty(self.chunk_size) for _ in range(n_slots)]
+        noise = np.empty(self.chunk_size) if self.noise_std > 0 else None
+        passed = np.empty(self.chunk_size, dtype=bool)
+
+        for start in range(0, samples, self.chunk_size):
+            end = min(start + self.chunk_size, samples)
+            m = end - start
+            for i in independent:
+                self.distributions[self.feature_names[i]].sample(rng, block[i, start:end])
+            if self.copula_chol is not None:
+                self._fill_copula(rng, block, start, end)
+
+            cols = {n: block[i, start:end] for i, n in enumerate(self.feature_names)}
+            s = score[start:end]
+            self._evaluate(cols, s, [b[:m] for b in scratch])
+
+            if noise is not None:
+                rng.standard_normal(out=noise[:m])
+                noise[:m] *= self.noise_std
+                s += noise[:m]
+
+            # ラベル = 超えた閾値の数 (クリップ前のスコアで判定)
+            t = target[start:end]
+            for th, inclusive in zip(self.thresholds, self.inclusive):
+                (np.greater_equal if inclusive else np.greater)(s, th, out=passed[:m])
+                t += passed[:m]
+            if self.clip is not None:
+                np.clip(s, self.clip[0], self.clip[1], out=s)
+
+        df = pd.DataFrame(block.T, columns=self.feature_names, copy=False)
+        df['target'] = target
+        df['score'] = score
+        return df
+
+    def score_frame(self, df):
+        """既存 DataFrame の特徴量から (ノイズ・クリップなしの) スコアを評価する。検証用。"""
+        out = np.empty(len(df))
+        for start in range(0, len(df), self.chunk_size):
+            end = min(start + self.chunk_size, len(df))
+            cols = {n: np.ascontiguousarray(df[n].values[start:end]) for n in self.feature_names}
+            n_slots = self._program.n_slots if self.backend == "ufunc" else 0
+            self._evaluate(cols, out[start:end], [np.empty(end - start) for _ in range(n_slots)])
+        return out
+
+
+def generate_from_scenario(spec_path, samples=1000000, seed=None, backend=None):
+    print(f"シナリオ {spec_path} からデータ生成を開始するのだ... (目標: {samples}件)")
+    start_time = time.time()
+    df = CompiledScenario(load_scenario(spec_path), backend=backend).generate(samples, seed=seed)
+    print(f"生成完了！ (実行時間: {time.time() - start_time:.2f}秒)")
+    return df
+
+
+# ── ベンチマーク ──
+def _measure(fn):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run_benchmark(spec_path, samples=1000000):
+    from big_data_generator import generate_big_romance_data
+
+    spec = load_scenario(spec_path)
+    print(f"\n── Benchmark: {samples:,} rows | spec {spec_path} ──")
+    print(f"{'implementation':<28} {'rows/s':>12} {'peak MB':>9}")
+
+    elapsed, peak = _measure(lambda: generate_big_romance_data(samples))
+    print(f"{'big_data_generator':<28} {samples / elapsed:>12,.0f} {peak / 2**20:>9.1f}")
+
+    backends = ["ufunc"] + (["numexpr"] if ne is not None else [])
+    for backend in backends:
+        engine = CompiledScenario(spec, backend=backend)
+        elapsed, peak = _measure(lambda: engine.generate(samples))
+        print(f"{'scenario_engine/' + backend:<28} {samples / elapsed:>12,.0f} {peak / 2**20:>9.1f}")
+
+    # 同じ特徴量で既存の式と一致するか確認
+    ref = generate_big_romance_data(min(samples, 100000))
+    ref_raw = CompiledScenario(spec).score_frame(ref)
+    ref_clip = np.clip(ref_raw, *spec.get("labels", {}).get("clip", [0, 100]))
+    print(f"\nmax |score diff| vs big_data_generator: {np.abs(ref_clip - ref['score'].values).max():.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Declarative synthetic data scenario engine")
+    parser.add_argument("spec", nargs="?", default=os.path.join(os.path.dirname(__file__), "scenarios", "default.yaml"))
+    parser.add_argument("--samples", type=int, default=1000000)
+    parser.add_argument("--out", default=None, help="pickle output path")
+    parser.add_argument("--backend", choices=["numexpr", "ufunc"], default=None)
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.spec, args.samples)
+    else:
+        df = generate_from_scenario(args.spec, args.samples, backend=args.backend)
+        if args.out:
+            df.to_pickle(args.out)
+            print(f"データセットを {args.out} に保存したのだ。")
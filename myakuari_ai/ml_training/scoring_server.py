@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from weight_blob import read_weight_blob
+
+"""
+【ローカル一括スコアリングサーバー】
+書き出し済みモデル (Edge-Transformer ONNX / ロジスティック回帰 / XGBoost) を
+1 度だけロードして常駐させ、同時に届いたリクエストをマイクロバッチにまとめて推論する。
+モデル更新後の過去診断の再スコアリングなど、本番の一括処理向け。
+
+  python scoring_server.py serve --port 8765
+  python scoring_server.py benchmark --model onnx --requests 20000 --concurrency 256
+
+HTTP API (JSON):
+  POST /score/<model>   {"features": [...]} または {"rows": [[...], ...]}  -> {"probs": [...]}
+  GET  /metrics         スループット・レイテンシ・平均バッチサイズ
+"""
+
+BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR   = os.path.join(BASE_DIR, "..", "assets", "ml")
+ONNX_PATH   = os.path.join(ASSET_DIR, "deep_romance_transformer.onnx")
+LR_WEIGHTS  = os.path.join(ASSET_DIR, "feature_weights.bin")
+XGB_PATH    = os.path.join(BASE_DIR, "deep_romance_xgb.ubj")
+XGB_META    = os.path.join(ASSET_DIR, "deep_ml_metadata.json")
+
+
+def _softmax(logits):
+    z = logits - logits.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+
+# ── モデルラッパー (どれも [N, F] float32 -> [N, 3] 確率) ──
+class OnnxModel:
+    def __init__(self, onnx_path, threads=1):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, opts, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.n_features = self.session.get_inputs()[0].shape[1]
+
+    def predict_proba(self, X):
+        logits = self.session.run(None, {self.input_name: X})[0]
+        return _softmax(logits.astype(np.float64))
+
+
+class LogisticModel:
+    """train_model.export_json が出力した蒸留ロジスティック回帰 (feature_weights.bin)。"""
+    def __init__(self, weights_path):
+        self.mean, self.std, coef, self.bias = read_weight_blob(weights_path)
+        self.coef = np.ascontiguousarray(coef.T)   # [F, 3]
+        self.n_features = len(self.mean)
+
+    def predict_proba(self, X):
+        logits = ((X - self.mean) / self.std) @ self.coef + self.bias
+        return _softmax(logits.astype(np.float64))
+
+
+class XGBoostModel:
+    def __init__(self, model_path, meta_path):
+        import xgboost as xgb
+        self.booster = xgb.Booster()
+        self.booster.load_model(model_path)
+        self.booster.set_param({"nthread": 1})
+        with open(meta_path, encoding='utf-8') as f:
+            self.n_features = len(json.load(f)["features"])
+
+    def predict_proba(self, X):
+        return self.booster.inplace_predict(X)
+
+
+def load_models():
+    """存在するアーティファクトだけをロードする。"""
+    models = {}
+    loaders = [
+        ("onnx",     lambda: OnnxModel(ONNX_PATH),           ONNX_PATH),
+        ("logistic", lambda: LogisticModel(LR_WEIGHTS),      LR_WEIGHTS),
+        ("xgboost",  lambda: XGBoostModel(XGB_PATH, XGB_META), XGB_PATH),
+    ]
+    for name, loader, path in loaders:
+        if not os.path.exists(path):
+            print(f"[skip] {name}: {path} が見つからないのだ")
+            continue
+        try:
+            models[name] = loader()
+            print(f"[load] {name}: {models[name].n_features} features")
+        except ImportError as e:
+            print(f"[skip] {name}: {e}")
+    return models
+
+
+# ── メトリクス ──
+class Metrics:
+    def __init__(self, window=10000):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.latencies_ms = []
+
+    def record_batch(self, n_rows):
+        self.batches += 1
+        self.rows += n_rows
+
+    def record_request(self, latency_ms):
+        self.requests += 1
+        self.latencies_ms.append(latency_ms)
+        if len(self.latencies_ms) > self.window * 2:
+            del self.latencies_ms[:-self.window]
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        lat = np.asarray(self.latencies_ms[-self.window:]) if self.latencies_ms else np.zeros(1)
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "batches": self.batches,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "throughput_rows_per_s": round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": round(float(np.percentile(lat, 50)), 3),
+                "p95": round(float(np.percentile(lat, 95)), 3),
+                "p99": round(float(np.percentile(lat, 99)), 3),
+            },
+        }
+
+
+# ── マイクロバッチャー ──
+class MicroBatcher:
+    """同時リクエストを max_batch_size 件 or 最初の 1 件から max_wait_ms 経過までまとめ、
+    スレッドプール上で 1 回の predict_proba にまとめて流す。"""
+
+    def __init__(self, model, executor, max_batch_size=64, max_wait_ms=2.0, max_inflight=4):
+        self.model = model
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = Metrics()
+        self._queue = asyncio.Queue()
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._task = None
+        self._dispatches = set()   # asyncio はタスクを弱参照でしか持たないので、完了まで保持する
+        self._closed = False
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """新規受付を止め、実行中のバッチは完了まで待ち、キューに残ったリクエストは失敗させる。"""
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+        while not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("scoring batcher stopped"))
+
+    async def submit(self, rows):
+        """rows: [k, F] float32。k 行分の確率 [k, 3] を返す。"""
+        if self._closed:
+            raise RuntimeError("scoring batcher stopped")
+        fut = asyncio.get_running_loop().create_future()
+        t0 = time.perf_counter()
+        await self._queue.put((rows, fut))
+        result = await fut
+        self.metrics.record_request((time.perf_counter() - t0) * 1000.0)
+        return result
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            await self._collect(loop, batch)
+        except asyncio.CancelledError:
+            # 集めかけのバッチ (キューからは取り出し済み) を宙に浮かせない
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(RuntimeError("scoring batcher stopped"))
+            raise
+
+    async def _collect(self, loop, batch):
+        while True:
+            batch.clear()
+            first = await self._queue.get()
+            batch.append(first)
+            n_rows = len(first[0])
+            deadline = loop.time() + self.max_wait
+            while n_rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(item)
+                n_rows += len(item[0])
+            await self._inflight.acquire()
+            task = loop.create_task(self._dispatch(list(batch)))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            X = np.ascontiguousarray(np.concatenate([rows for rows, _ in batch]), dtype=np.float32)
+            probs = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.model.predict_proba, X)
+            self.metrics.record_batch(len(X))
+            offset = 0
+            for rows, fut in batch:
+                if not fut.done():
+                    fut.set_result(probs[offset:offset + len(rows)])
+                offset += len(rows)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            self._inflight.release()
+
+
+# ── HTTP フロントエンド (標準ライブラリのみ、keep-alive 対応) ──
+class ScoringServer:
+    def __init__(self, models, max_batch_size=64, max_wait_ms=2.0, workers=4):
+        self.models = models
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.batchers = {
+            name: MicroBatcher(model, self.executor, max_batch_size, max_wait_ms, max_inflight=workers)
+            for name, model in models.items()
+        }
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('ascii').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    k, v = line.decode('latin-1').split(':', 1)
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                await self._route(writer, method, path, body)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, writer, method, path, body):
+        if method == 'GET' and path == '/metrics':
+            await self._respond(writer, 200, {n: b.metrics.snapshot() for n, b in self.batchers.items()})
+            return
+        if method == 'POST' and path.startswith('/score/'):
+            name = path[len('/score/'):]
+            batcher = self.batchers.get(name)
+            if batcher is None:
+                await self._respond(writer, 404, {"error": f"unknown model: {name}"})
+                return
+            try:
+                payload = json.loads(body)
+                rows = payload["rows"] if "rows" in payload else [payload["features"]]
+                X = np.asarray(rows, dtype=np.float32).reshape(len(rows), -1)
+                if X.shape[1] != batcher.model.n_features:
+                    raise ValueError(f"expected {batcher.model.n_features} features, got {X.shape[1]}")
+            except (KeyError, ValueError, TypeError) as e:
+                await self._respond(writer, 400, {"error": str(e)})
+                return
+            try:
+                probs = await batcher.submit(X)
+            except Exception as e:
+                await self._respond(writer, 500, {"error": str(e)})
+                return
+            await self._respond(writer, 200, {"probs": probs.tolist()})
+            return
+        await self._respond(writer, 404, {"error": "not found"})
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        for b in self.batchers.values():
+            b.start()
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"スコアリングサーバー起動なのだ: http://{host}:{port} (models: {', '.join(self.models)})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await asyncio.gather(*(b.stop() for b in self.batchers.values()))
+
+
+# ── ロードジェネレーター (ベンチマーク) ──
+async def _load_generator(batcher, n_features, total_requests, concurrency):
+    rng = np.random.default_rng(42)
+    pool = rng.random((1024, n_features), dtype=np.float32)
+    counter = iter(range(total_requests))
+
+    async def worker():
+        for i in counter:
+            await batcher.submit(pool[i % len(pool)][None, :])
+
+    batcher.metrics.reset()
+    batcher.start()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    await batcher.stop()
+    snap = batcher.metrics.snapshot()
+    snap["throughput_rows_per_s"] = round(total_requests / elapsed, 1)
+    return snap
+
+
+def run_benchmark(model_name, total_requests=20000, concurrency=256,
+                  batch_sizes=(1, 8, 32, 128), max_wait_ms=2.0, workers=4):
+    """同じ負荷を max_batch_size だけ変えて流し、マイクロバッチによるスループット向上を比較する。"""
+    models = load_models()
+    if model_name not in models:
+        raise SystemExit(f"モデル {model_name} がロードできないのだ")
+    model = models[model_name]
+
+    print(f"\n── Benchmark: {model_name} | {total_requests:,} req | concurrency {concurrency} "
+          f"| max_wait {max_wait_ms} ms | workers {workers} ──")
+    print(f"{'max_batch':>9} {'avg_batch':>9} {'rows/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    baseline = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for bs in batch_sizes:
+            async def run():
+                batcher = MicroBatcher(model, executor, max_batch_size=bs, max_wait_ms=max_wait_ms,
+                                       max_inflight=workers)
+                return await _load_generator(batcher, model.n_features, total_requests, concurrency)
+            snap = asyncio.run(run())
+            tput = snap["throughput_rows_per_s"]
+            baseline = baseline or tput
+            lat = snap["latency_ms"]
+            print(f"{bs:>9} {snap['avg_batch_size']:>9.1f} {tput:>10,.0f} {lat['p50']:>8.2f} "
+                  f"{lat['p95']:>8.2f} {lat['p99']:>8.2f} {tput / baseline:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching scoring server")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_serve = sub.add_parser("serve")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_serve.add_argument("--max-batch-size", type=int, default=64)
+    p_serve.add_argument("--max-wait-ms", type=float, default=2.0)
+    p_serve.add_argument("--workers", type=int, default=4)
+
+    p_bench = sub.add_parser("benchmark")
+    p_bench.add_argument("--model", default="onnx", choices=["onnx", "logistic", "xgboost"])
+    p_bench.add_argument("--requests", type=int, default=20000)
+    p_bench.add_argument("--concurrency", type=int, default=256)
+    p_bench.add_argument("--max-wait-ms", type=float, default=2.0)
+    p_bench.add_argument("--workers", type=int, default=4)
+
+    args = parser.parse_args()
+    if args.cmd == "serve":
+        server = ScoringServer(load_models(), args.max_batch_size, args.max_wait_ms, args.workers)
+        asyncio.run(server.serve(args.host, args.port))
+    else:
+        run_benchmark(args.model, args.requests, args.concurrency,
+                      max_wait_ms=args.max_wait_ms, workers=args.workers)
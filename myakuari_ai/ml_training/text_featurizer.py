@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import time
+import unicodedata
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+"""
+【テキスト特徴量化パイプライン】
+RealDataCollector が集めた Q&A (context の自由文 + extracted_features + community_label) を、
+big_data_generator / 各トレーナーと同じ 24 特徴量 + target + score の列形式に変換する。
+
+- 手がかり語の検出: 全ルールの語句を 1 つの Aho-Corasick オートマトンに事前コンパイルし、1 パスで照合
+  (pyahocorasick があればそれを、なければ純 Python 実装を使う)
+- JSONL シャード単位で multiprocessing.Pool に分散
+
+FEATURE_RULES / FIELD_RULES / EXACT_RULES はアプリの OnnxInferenceEngine._extract24FeaturesDart と
+手がかり語・値・優先順位まで同じにしてある。アプリは正規化せずに String.contains で判定するので、
+特徴量の手がかり語も生のテキストに対して照合する (学習時と推論時で同じ入力が同じ値になるように)。
+NFKC などの正規化 (normalize) はコミュニティ判定のラベル付けにだけ使う。
+
+  python text_featurizer.py shards/*.jsonl --out real_romance_dataset.pkl
+  python text_featurizer.py real_world_samples.json --out real_romance_dataset.pkl
+"""
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+FEATURES = [
+    'reply_speed_avg', 'reply_speed_var', 'msg_len_ratio', 'initiation_ratio',
+    'sticker_freq', 'sticker_sync', 'emotion_density', 'question_freq',
+    'self_disclosure', 'date_proposal_count', 'concreteness', 'honorific_casual_ratio',
+    'night_time_ratio', 'weekend_comm_ratio', 'keyword_overlap', 'indirect_inv_count',
+    'soft_denial_freq', 'read_ignore_duration', 'pers_question_count', 'compliment_freq',
+    'context_consistency', 'future_ref_count', 'third_party_ref', 'social_dist_type',
+]
+
+# 特徴量 -> (手がかりがないときの値, [(手がかり語, 値), ...])  ※先に書いたルールが優先
+# アプリでは what/why/how/where の自由文 (ここでは context) に対する判定
+FEATURE_RULES = {
+    'reply_speed_avg':        (0.4, [(('即レス',), 0.9), (('早い',), 0.7)]),
+    'reply_speed_var':        (0.2, [(('ムラがある',), 0.8)]),
+    'msg_len_ratio':          (0.5, [(('長文',), 0.8)]),
+    'initiation_ratio':       (0.5, []),
+    'sticker_freq':           (0.3, [(('スタンプ',), 0.7)]),
+    'sticker_sync':           (0.4, [(('同じスタンプ', '似てる'), 0.9)]),
+    'emotion_density':        (0.3, [(('！', 'ｗ'), 0.6)]),
+    'question_freq':          (0.4, [(('質問',), 0.8)]),
+    'self_disclosure':        (0.5, [(('悩み',), 0.9)]),
+    'date_proposal_count':    (0.0, [(('誘われた',), 1.0), (('誘った',), 0.3)]),
+    'concreteness':           (0.3, []),
+    'honorific_casual_ratio': (0.3, [(('タメ口',), 0.9)]),
+    'night_time_ratio':       (0.4, [(('夜',), 0.7)]),
+    'weekend_comm_ratio':     (0.5, [(('週末',), 0.8)]),
+    'keyword_overlap':        (0.4, [(('共通',), 0.8)]),
+    'indirect_inv_count':     (0.2, [(('今度',), 0.6)]),
+    'soft_denial_freq':       (0.1, [(('忙しい',), 0.8)]),
+    'read_ignore_duration':   (0.1, [(('既読無視',), 0.9)]),
+    'pers_question_count':    (0.3, [(('彼女', '彼氏'), 0.9)]),
+    'compliment_freq':        (0.2, [(('かっこいい', '可愛い'), 0.8)]),
+    'context_consistency':    (0.4, [(('ずっと',), 0.7)]),
+    'future_ref_count':       (0.3, [(('来月', '将来'), 0.8)]),
+    'third_party_ref':        (0.3, [(('友達',), 0.6)]),
+    'social_dist_type':       (0.5, []),
+}
+
+# extracted_features のキー -> (特徴量, [(手がかり語, 値), ...])  アプリの input.who と同じ部分一致判定
+FIELD_RULES = {
+    'who': ('social_dist_type', [(('アプリ',), 1.0), (('職場',), 0.1)]),  # 0.1:Work, 0.5:School, 1.0:App
+}
+
+# extracted_features のキー -> (特徴量, {値: 特徴量の値})  アプリの input.initiative / concreteness と同じ完全一致判定
+EXACT_RULES = {
+    'initiative':   ('initiation_ratio', {'相手': 0.9, '自分': 0.2}),
+    'concreteness': ('concreteness', {'YES': 1.0}),
+}
+
+# community_label -> target (0: 脈ナシ, 1: 五分, 2: 脈アリ)
+LABEL_RULES = [(('脈あり',), 2), (('脈なし',), 0), (('五分', '微妙', 'わからない', 'どちらとも'), 1)]
+LABEL_SCORE = {0: 20.0, 1: 50.0, 2: 80.0}
+
+
+# ── 正規化 ──
+_KANA_FOLD = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}   # ァ-ヶ -> ぁ-ゖ
+_KANA_FOLD.update({ord(c): '~' for c in '〜～'})
+_KANA_FOLD.update({ord(c): None for c in ' \t\r\n　'})
+
+
+def normalize(text):
+    """NFKC で全角/半角を揃え、小文字化・カタカナのひらがな化・空白除去を行う。"""
+    return unicodedata.normalize('NFKC', text).lower().translate(_KANA_FOLD)
+
+
+# ── Aho-Corasick ──
+class _PyAhoCorasick:
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.out = [[]]
+        for pid, pat in enumerate(patterns):
+            state = 0
+            for ch in pat:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.out.append([])
+                state = nxt
+            self.out[state].append(pid)
+
+        # 幅優先で failure リンクを張り、出力を継承する
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for s in queue:
+            for ch, nxt in self.goto[s].items():
+                queue.append(nxt)
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0) if self.goto[f].get(ch, 0) != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class _CAhoCorasick:
+    def __init__(self, patterns):
+        self.automaton = ahocorasick.Automaton()
+        for pid, pat in enumerate(patterns):
+            self.automaton.add_word(pat, pid)
+        self.automaton.make_automaton()
+
+    def find(self, text):
+        return {pid for _, pid in self.automaton.iter(text)}
+
+
+def build_automaton(patterns):
+    return (_CAhoCorasick if ahocorasick is not None else _PyAhoCorasick)(patterns)
+
+
+class CueMatcher:
+    """{キー: [(手がかり語, 値), ...]} を 1 つのオートマトンにまとめ、
+    テキスト中で見つかったキーごとに最も優先度の高いルールの値を返す。
+    fold を渡すと、手がかり語とテキストの両方にかけてから照合する。"""
+
+    def __init__(self, rules, fold=None):
+        self.fold = fold
+        self.keys = list(rules)
+        patterns, hits = {}, []
+        for k, key in enumerate(self.keys):
+            for rank, (cues, value) in enumerate(rules[key]):
+                for cue in cues:
+                    if fold is not None:
+                        cue = fold(cue)
+                    if cue not in patterns:
+                        patterns[cue] = len(hits)
+                        hits.append([])
+                    hits[patterns[cue]].append((k, rank, value))
+        self.hits = hits
+        self.automaton = build_automaton(list(patterns))
+
+    def match(self, text):
+        if self.fold is not None:
+            text = self.fold(text)
+        best = {}
+        for pid in self.automaton.find(text):
+            for k, rank, value in self.hits[pid]:
+                if k not in best or rank < best[k][0]:
+                    best[k] = (rank, value)
+        return {self.keys[k]: v for k, (_, v) in best.items()}
+
+
+# ── 特徴量化 ──
+class Featurizer:
+    def __init__(self):
+        self.defaults = np.array([FEATURE_RULES[f][0] for f in FEATURES])
+        self.index = {f: i for i, f in enumerate(FEATURES)}
+        self.text_matcher = CueMatcher({f: FEATURE_RULES[f][1] for f in FEATURES if FEATURE_RULES[f][1]})
+        self.field_matchers = {
+            key: (feature, CueMatcher({feature: rules})) for key, (feature, rules) in FIELD_RULES.items()
+        }
+        self.label_matcher = CueMatcher({'label': list(LABEL_RULES)}, fold=normalize)
+
+    def label(self, record):
+        text = record.get('community_label')
+        if not text:
+            return None
+        return self.label_matcher.match(text).get('label')
+
+    def transform(self, records):
+        """records を [n, 24] に特徴量化し、(X, target, score, ラベルなし件数) を返す。
+        ラベルの付いていないレコードは学習に使えないので除外する。"""
+        X = np.empty((len(records), len(FEATURES)))
+        target = np.empty(len(records), dtype=np.int64)
+        score = np.empty(len(records))
+        n = 0
+        for rec in records:
+            y = self.label(rec)
+            if y is None:
+                continue
+            row = X[n]
+            row[:] = self.defaults
+            for f, v in self.text_matcher.match(rec.get('context', '')).items():
+                row[self.index[f]] = v
+            for key, value in (rec.get('extracted_features') or {}).items():
+                if not isinstance(value, str):
+                    continue
+                if key in self.field_matchers:
+                    feature, matcher = self.field_matchers[key]
+                    hit = matcher.match(value).get(feature)
+                elif key in EXACT_RULES:
+                    feature, values = EXACT_RULES[key]
+                    hit = values.get(value)
+                else:
+                    continue
+                if hit is not None:
+                    row[self.index[feature]] = hit
+            # score: 0-100 (コミュニティ判定をラベル中心に、確信度で両端へ寄せる)
+            conf = float(rec.get('confidence', 0.5))
+            score[n] = LABEL_SCORE[y] + (LABEL_SCORE[y] - 50.0) * conf * 0.25
+            target[n] = y
+            n += 1
+        return X[:n], target[:n], score[:n], len(records) - n
+
+
+def read_shard(path):
+    """JSONL (1 行 1 レコード) または JSON 配列 (real_world_samples.json 形式) を読む。"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
+
+_featurizer = None
+
+
+def _init_worker():
+    global _featurizer
+    _featurizer = Featurizer()   # オートマトンはプロセスごとに 1 回だけコンパイル
+
+
+def _featurize_shard(path):
+    records = read_shard(path)
+    X, target, score, n_unlabeled = _featurizer.transform(records)
+    return path, X, target, score, len(records), n_unlabeled
+
+
+def featurize_shards(paths, processes=None):
+    """シャードをプロセスプールで並列に特徴量化し、トレーナーと同じ列形式の DataFrame を返す。"""
+    print(f"テキスト特徴量化を開始するのだ... ({len(paths)} シャード, matcher: "
+          f"{'pyahocorasick' if ahocorasick is not None else 'pure-python'})")
+    start_time = time.time()
+    parts, n_total, n_unlabeled = [], 0, 0
+    processes = min(processes or os.cpu_count() or 1, len(paths)) or 1
+    with Pool(processes, initializer=_init_worker) as pool:
+        for path, X, target, score, n, n_unl in pool.imap_unordered(_featurize_shard, paths):
+            parts.append((path, X, target, score))
+            n_total += n
+            n_unlabeled += n_unl
+    parts.sort(key=lambda p: p[0])   # シャード順に並べて再現性を保つ
+
+    df = pd.DataFrame(np.concatenate([p[1] for p in parts]) if parts else np.empty((0, len(FEATURES))),
+                      columns=FEATURES)
+    df['target'] = np.concatenate([p[2] for p in parts]) if parts else np.empty(0, dtype=np.int64)
+    df['score'] = np.concatenate([p[3] for p in parts]) if parts else np.empty(0)
+
+    elapsed = time.time() - start_time
+    rate = n_total / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"特徴量化完了！ {n_total}件 (ラベルなし {n_unlabeled}件を除外) / {elapsed:.2f}秒 "
+          f"({rate:,.0f} 件/分)")
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Japanese Q&A text -> 24-feature training rows")
+    parser.add_argument("shards", nargs="+", help="JSONL shards (or a JSON array file)")
+    parser.add_argument("--out", required=True, help="pickle output path")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    df = featurize_shards(args.shards, args.processes)
+    df.to_pickle(args.out)
+    print(f"データセットを {args.out} に保存したのだ。xgboost_trainer.py の追加学習に回すのだ！")
@@ -0,0 +1,67 @@
+import struct
+
+"""
+推論用の重みをコンパクトなリトルエンディアンのバイナリとして書き出す / 読み込む。
+Dart 側はこれを Float32List としてコピーなしで参照する (MLInferenceEngine)。
+
+レイアウト (version 1, 全てリトルエンディアン):
+  0  char[4]  magic      b"MKW1"
+  4  uint16   version    1
+  6  uint16   flags      0 (予約)
+  8  uint16   n_features F
+  10 uint16   n_classes  C
+  12 uint32   reserved   0
+  16 float32  mean[F]
+     float32  std[F]
+     float32  coef[C][F] (行優先)
+     float32  bias[C]
+ヘッダーは 16 バイトなので float32 配列は常に 4 バイト境界に揃う。
+"""
+
+MAGIC = b"MKW1"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHHHI")
+HEADER_SIZE = _HEADER.size
+
+
+def _flatten(values):
+    out = []
+    for v in values:
+        if hasattr(v, "__len__"):
+            out.extend(_flatten(v))
+        else:
+            out.append(float(v))
+    return out
+
+
+def write_weight_blob(path, mean, std, coef, bias):
+    """mean/std: [F], coef: [C][F], bias: [C] (list でも numpy 配列でも可)。"""
+    mean, std, bias = _flatten(mean), _flatten(std), _flatten(bias)
+    n_features, n_classes = len(mean), len(bias)
+    coef = _flatten(coef)
+    if len(std) != n_features or len(coef) != n_classes * n_features:
+        raise ValueError(f"shape mismatch: F={n_features}, C={n_classes}, coef={len(coef)}")
+
+    payload = mean + std + coef + bias
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, n_features, n_classes, 0))
+        f.write(struct.pack(f"<{len(payload)}f", *payload))
+    return HEADER_SIZE + 4 * len(payload)
+
+
+def read_weight_blob(path):
+    """(mean, std, coef, bias) を numpy float32 配列で返す (coef は [C, F])。"""
+    import numpy as np
+    with open(path, "rb") as f:
+        buf = f.read()
+    magic, version, _, n_features, n_classes, _ = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"unsupported weight blob: magic={magic!r} version={version}")
+
+    data = np.frombuffer(buf, dtype="<f4", offset=HEADER_SIZE)
+    F, C = n_features, n_classes
+    mean = data[0:F]
+    std  = data[F:2 * F]
+    coef = data[2 * F:2 * F + C * F].reshape(C, F)
+    bias = data[2 * F + C * F:2 * F + C * F + C]
+    return mean, std, coef, bias
@@ -1,14 +1,33 @@
 import pandas as pd
 import numpy as np
 import xgboost as xgb
+import json
+import os
+import shutil
+from tree_shap import from_xgboost, build_attribution_model
 # import onnx
 # import onnxmltools
 # from onnxmltools.convert.common.data_types import FloatTensorType
 
 """
 1,000,000 件のビッグデータを XGBoost で学習し、ONNX 形式へエクスポートする。
+新しいラベル付きデータが届いたときは update_exclusive_model で前回のブースターから追加学習する。
 """
 
+MODEL_PATH = "c:/Projects/myakuarimyakunasiAIkunn/myakuari_ai/ml_training/deep_romance_xgb.ubj"
+META_PATH  = "c:/Projects/myakuarimyakunasiAIkunn/myakuari_ai/assets/ml/deep_ml_metadata.json"
+
+PARAMS = dict(
+    max_depth=6,
+    learning_rate=0.05,
+    subsample=0.8,
+    colsample_bytree=0.8,
+    objective='multi:softprob',
+    num_class=3,
+    tree_method='hist', # 100万件なら必須
+    random_state=42
+)
+
 def train_exclusive_model(pickle_path):
     print(f"データセット {pickle_path} を読み込み中なのだ...")
     df = pd.read_pickle(pickle_path)
@@ -18,17 +37,7 @@ def train_exclusive_model(pickle_path):
     
     print(f"学習を開始するのだ... (XGBoost GPU or CPU)")
     # ハイパーパラメータの設定 (100万件に最適化)
-    clf = xgb.XGBClassifier(
-        n_estimators=500,
-        max_depth=6,
-        learning_rate=0.05,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        objective='multi:softprob',
-        num_class=3,
-        tree_method='hist', # 100万件なら必須
-        random_state=42
-    )
+    clf = xgb.XGBClassifier(n_estimators=500, **PARAMS)
     
     clf.fit(X, y)
     print("モデルの学習が完了したのだ！")
@@ -48,14 +57,140 @@ def train_exclusive_model(pickle_path):
         "features": list(X.columns),
         "classes": ["脈ナシ", "五分", "脈アリ"],
         "accuracy": float(acc),
-        "engine": "XGBoost-1M-Deep"
+        "engine": "XGBoost-1M-Deep",
+        "attribution_model": _attribution(clf.get_booster(), X),
     }
     
-    import json
-    with open("c:/Projects/myakuarimyakunasiAIkunn/myakuari_ai/assets/ml/deep_ml_metadata.json", "w", encoding='utf-8') as f:
+    with open(META_PATH, "w", encoding='utf-8') as f:
         json.dump(metadata, f, ensure_ascii=False, indent=2)
         
     print("モデルのメタデータを assets/ml/deep_ml_metadata.json に保存したのだ。")
+    
+    # ブースター本体も保存 (scoring_server.py での一括推論・追加学習に使用)
+    clf.get_booster().save_model(MODEL_PATH)
+    print("ブースターを ml_training/deep_romance_xgb.ubj に保存したのだ。")
+
+def _attribution(booster, X, n_samples=5000):
+    """TreeSHAP (脈アリの softmax マージン) を特徴量ごとの区分線形モデルに蒸留してメタデータに載せる。"""
+    sample = X.sample(n=min(len(X), n_samples), random_state=42)
+    return build_attribution_model(from_xgboost(booster), sample.values, list(X.columns),
+                                   target_class=2, target_name="脈アリ")
+
+def _evaluate(booster, X, y, w=None):
+    """accuracy と (重み付き) mlogloss を返す。"""
+    probs = booster.predict(xgb.DMatrix(X))
+    w = np.ones(len(y)) if w is None else np.asarray(w, dtype=np.float64)
+    acc = float(np.average(probs.argmax(axis=1) == y, weights=w))
+    p_true = np.clip(probs[np.arange(len(y)), y], 1e-15, 1.0)
+    logloss = float(np.average(-np.log(p_true), weights=w))
+    return {"accuracy": acc, "logloss": logloss}
+
+def update_exclusive_model(new_data_path, replay_pickle_path, extra_rounds=50, replay_size=200000,
+                           real_weight=5.0, holdout_frac=0.2, tolerance=0.002, force=False):
+    """前回のブースターを読み込み、新しいラベル付きデータ + 合成データのリプレイで追加学習する。
+
+    new_data_path: 学習用データセットと同じ列構成 (24 特徴量 + target) の pickle。
+                   sample_weight 列があればそれを、なければ real_weight を重みに使う。
+    比較用ホールドアウト (新データ・合成データそれぞれの holdout_frac) で前回モデルと比べ、
+    新データで悪化せず、合成データでの精度低下が tolerance 以内なら昇格させる。
+
+    注意:
+    - 新データが少なくてホールドアウトを取れないときは学習に使った行でしか比較できないので、
+      force=True でない限り昇格しない。
+    - 合成データの「ホールドアウト」は追加学習には使わないが、replay_pickle_path が前回モデルの
+      学習データと同じなら前回モデルにとっては学習済みの行である。合成データ側の比較は
+      汎化性能ではなく「前回の学習内容を忘れていないか」のチェックとして扱う。
+    """
+    print(f"前回のモデル {MODEL_PATH} を読み込むのだ...")
+    previous = xgb.Booster()
+    previous.load_model(MODEL_PATH)
+    with open(META_PATH, encoding='utf-8') as f:
+        metadata = json.load(f)
+    features = metadata["features"]
+
+    rng = np.random.default_rng(42)
+
+    # 新しいラベル付きデータ (実データ)
+    new_df = pd.read_pickle(new_data_path)
+    if "sample_weight" not in new_df:
+        new_df["sample_weight"] = real_weight
+    idx = rng.permutation(len(new_df))
+    n_hold = int(len(new_df) * holdout_frac) if len(new_df) >= 5 else 0
+    new_hold, new_train = new_df.iloc[idx[:n_hold]], new_df.iloc[idx[n_hold:]]
+    in_sample = n_hold == 0
+    if in_sample:
+        print("新データが少ないので、学習に使ったデータで比較するのだ (参考値、force=True でなければ昇格しない)。")
+        new_hold = new_train
+
+    # 忘却を防ぐための合成データのリプレイ (+ 忘却チェック用のホールドアウト。前回モデルは学習済みの可能性あり)
+    syn_df = pd.read_pickle(replay_pickle_path)
+    if len(syn_df) < 2:
+        raise ValueError(f"合成データが {len(syn_df)} 件しかないので、リプレイと比較用ホールドアウトに分けられないのだ: "
+                         f"{replay_pickle_path}")
+    # ホールドアウトを先に確保し、残りからリプレイを取る (リプレイ件数は残りの件数まで)
+    n_syn_hold = max(1, int(len(syn_df) * holdout_frac))
+    n_replay = min(replay_size, len(syn_df) - n_syn_hold)
+    syn_idx = rng.permutation(len(syn_df))
+    syn_hold = syn_df.iloc[syn_idx[:n_syn_hold]]
+    replay = syn_df.iloc[syn_idx[n_syn_hold:n_syn_hold + n_replay]]
+    del syn_df
+
+    X_train = pd.concat([new_train[features], replay[features]], ignore_index=True)
+    y_train = np.concatenate([new_train["target"].values, replay["target"].values])
+    w_train = np.concatenate([new_train["sample_weight"].values, np.ones(len(replay))])
+
+    print(f"追加学習を開始するのだ... (実データ {len(new_train)}件 x 重み / リプレイ {len(replay)}件, "
+          f"+{extra_rounds} rounds)")
+    clf = xgb.XGBClassifier(n_estimators=extra_rounds, **PARAMS)
+    clf.fit(X_train, y_train, sample_weight=w_train, xgb_model=previous)
+    candidate = clf.get_booster()
+
+    y_new, y_syn = new_hold["target"].values, syn_hold["target"].values
+    report = {
+        "previous": {
+            "new": _evaluate(previous, new_hold[features], y_new, new_hold["sample_weight"]),
+            "synthetic": _evaluate(previous, syn_hold[features], y_syn),
+        },
+        "candidate": {
+            "new": _evaluate(candidate, new_hold[features], y_new, new_hold["sample_weight"]),
+            "synthetic": _evaluate(candidate, syn_hold[features], y_syn),
+        },
+    }
+    for name in ("previous", "candidate"):
+        r = report[name]
+        print(f"  {name:9s} | 新データ acc {r['new']['accuracy']:.4f} logloss {r['new']['logloss']:.4f} "
+              f"| 合成 acc {r['synthetic']['accuracy']:.4f} logloss {r['synthetic']['logloss']:.4f}")
+
+    prev_r, cand_r = report["previous"], report["candidate"]
+    if in_sample and not force:
+        print("新データのホールドアウトがなく公平に比較できないので、昇格は見送るのだ (force=True で強制昇格)。")
+        return candidate, report, False
+    promote = force or (
+        cand_r["new"]["logloss"] <= prev_r["new"]["logloss"]
+        and cand_r["synthetic"]["accuracy"] >= prev_r["synthetic"]["accuracy"] - tolerance
+    )
+    if not promote:
+        print("新しいモデルは前回より良くならなかったので、昇格は見送るのだ。")
+        return candidate, report, False
+
+    shutil.copyfile(MODEL_PATH, MODEL_PATH.replace(".ubj", ".prev.ubj"))
+    candidate.save_model(MODEL_PATH)
+    # "accuracy" はフル学習時の値のまま残し、追加学習時のホールドアウト評価は別キーに置く
+    metadata["last_update"] = cand_r
+    metadata["incremental_updates"] = metadata.get("incremental_updates", 0) + 1
+    metadata["n_rounds"] = candidate.num_boosted_rounds()
+    metadata["attribution_model"] = _attribution(candidate, pd.concat([new_train[features], replay[features]]))
+    with open(META_PATH, "w", encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    print(f"新しいモデルを昇格したのだ！ (前回のモデルは {os.path.basename(MODEL_PATH.replace('.ubj', '.prev.ubj'))} に退避)")
+    print("※ 合成データ側の比較は前回モデルの学習データと重なりうるので、汎化ではなく忘却チェックの参考値なのだ。")
+    return candidate, report, True
 
 if __name__ == "__main__":
-    train_exclusive_model("c:/Projects/myakuarimyakunasiAIkunn/myakuari_ai/ml_training/big_romance_dataset.pkl")
+    import sys
+    data_path = "c:/Projects/myakuarimyakunasiAIkunn/myakuari_ai/ml_training/big_romance_dataset.pkl"
+    if len(sys.argv) > 1:
+        # 新しいラベル付きデータの pickle が指定されたら追加学習モード
+        update_exclusive_model(sys.argv[1], data_path)
+    else:
+        train_exclusive_model(data_path)
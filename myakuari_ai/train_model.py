@@ -12,11 +12,14 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import GradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, accuracy_score
+from ml_training.weight_blob import write_weight_blob, VERSION as WEIGHTS_VERSION
+from ml_training.tree_shap import from_sklearn_gbm, build_attribution_model
 
 DATA_ZIP   = "speed-dating-experiment.zip"
 DATA_CSV   = "Speed Dating Data.csv"
 OUT_DIR    = "assets/ml"
 META_OUT   = os.path.join(OUT_DIR, "feature_metadata.json")
+WEIGHTS_OUT = os.path.join(OUT_DIR, "feature_weights.bin")
 
 # Speed Dating Data の実際のカラム名で定義
 FEATURE_COLS = [
@@ -72,7 +75,7 @@ def train(X, y):
     print(classification_report(y_te, gbm.predict(X_te_s), target_names=["脈ナシ","中立","脈アリ"]))
     return gbm, scaler, acc
 
-def export_json(gbm, scaler, acc):
+def export_json(gbm, scaler, acc, X):
     os.makedirs(OUT_DIR, exist_ok=True)
 
     # GBMをLogistic回帰で蒸留（Dartで行列演算するため）
@@ -83,6 +86,13 @@ def export_json(gbm, scaler, acc):
     lr.fit(X_syn, y_soft)
 
     feat_imp = gbm.feature_importances_.tolist()
+
+    # 個別の予測に対する寄与: GBM の TreeSHAP (脈アリの softmax マージン) を特徴量ごとの区分線形モデルに蒸留
+    rng = np.random.default_rng(42)
+    X_shap = scaler.transform(X[rng.choice(len(X), min(len(X), 5000), replace=False)])
+    attribution = build_attribution_model(
+        from_sklearn_gbm(gbm), X_shap, FEATURE_COLS, target_class=2, target_name="脈アリ",
+        raw_mean=scaler.mean_, raw_std=scaler.scale_)
     meta = {
         "version": "1.0",
         "source": "Columbia University Speed Dating Experiment (Fisman et al., 2006)",
@@ -90,11 +100,11 @@ def export_json(gbm, scaler, acc):
         "features": FEATURE_COLS,
         "n_features": len(FEATURE_COLS),
         "labels": ["脈ナシ", "中立", "脈アリ"],
-        "scaler_mean": scaler.mean_.tolist(),
-        "scaler_std":  scaler.scale_.tolist(),
-        "lr_coef":     lr.coef_.tolist(),   # shape [3, 10]
-        "lr_bias":     lr.intercept_.tolist(), # shape [3]
+        # scaler / lr 係数は feature_weights.bin (float32 バイナリ) に格納
+        "weights_file": os.path.basename(WEIGHTS_OUT),
+        "weights_version": WEIGHTS_VERSION,
         "feature_importance": {f: round(v,4) for f,v in zip(FEATURE_COLS, feat_imp)},
+        "attribution_model": attribution,
         "feature_description": {
             "attr_o":   "相手から見た魅力度 (1-10)",
             "sinc_o":   "誠実さ評価 (1-10)",
@@ -118,7 +128,11 @@ def export_json(gbm, scaler, acc):
     with open(META_OUT, 'w', encoding='utf-8') as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
 
+    # 数値はバイナリへ (coef: [3, 10], bias: [3])
+    n_bytes = write_weight_blob(WEIGHTS_OUT, scaler.mean_, scaler.scale_, lr.coef_, lr.intercept_)
+
     print(f"\nSaved: {META_OUT}")
+    print(f"Saved: {WEIGHTS_OUT} ({n_bytes} bytes)")
     print("\nFeature Importance (GBM):")
     for name, imp in sorted(zip(FEATURE_COLS, feat_imp), key=lambda x: -x[1]):
         bar = "█" * int(imp*40)
@@ -128,7 +142,7 @@ def main():
     print("=== Speed Dating ML Training ===\n")
     X, y = load_data()
     gbm, scaler, acc = train(X, y)
-    export_json(gbm, scaler, acc)
+    export_json(gbm, scaler, acc, X)
     print("\nDone! Update MLInferenceEngine.dart to use feature_metadata.json")
 
 if __name__ == "__main__":